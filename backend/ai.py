@@ -1,12 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import Dict, Any
 import os
 import logging
-from database import get_db
+from database import get_db, statement_timeout, READ_STATEMENT_TIMEOUT_MS
 from auth import get_current_active_user
 from models import User, Transaction, Loan, Category
 from ai_service import FinancialAIAgent
+import fx
 
 router = APIRouter(prefix="/ai", tags=["AI Assistant"])
 logger = logging.getLogger(__name__)
@@ -23,7 +25,30 @@ def get_ai_agent():
         _ai_agent = FinancialAIAgent(api_key=api_key)
     return _ai_agent
 
-@router.post("/chat")
+def _converted_totals(db: Session, user_id: int):
+    """Spending per category and total loans, in fx.BASE_CURRENCY.
+
+    Amounts are summed per (currency, day) in SQL and each group is converted
+    once, so the cost does not grow with the number of rows.
+    """
+    category = func.coalesce(Category.name, "Uncategorized")
+    spent = db.query(category, Transaction.currency, func.date(Transaction.date), func.sum(Transaction.amount))\
+        .outerjoin(Category, Transaction.category_id == Category.id)\
+        .filter(Transaction.user_id == user_id)\
+        .group_by(category, Transaction.currency, func.date(Transaction.date))\
+        .all()
+    loans = db.query(Loan.currency, func.date(Loan.start_date), func.sum(Loan.amount))\
+        .filter(Loan.user_id == user_id)\
+        .group_by(Loan.currency, func.date(Loan.start_date))\
+        .all()
+    try:
+        by_category = fx.sum_in_base(spent)
+        loan_total = fx.sum_in_base(("loans", currency, day, amount) for currency, day, amount in loans)
+    except fx.MissingRateError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return by_category, loan_total.get("loans", 0)
+
+@router.post("/chat", dependencies=[Depends(statement_timeout(READ_STATEMENT_TIMEOUT_MS))])
 async def chat_with_ai(
     request: Dict[str, str],
     db: Session = Depends(get_db),
@@ -42,18 +67,24 @@ async def chat_with_ai(
     loans = db.query(Loan).filter(Loan.user_id == current_user.id).all()
     categories = db.query(Category).filter((Category.user_id == current_user.id) | (Category.user_id == None)).all()
     
+    by_category, loan_total = _converted_totals(db, current_user.id)
+
     user_data = {
+        "currency": fx.BASE_CURRENCY,
+        "total_spent": float(sum(by_category.values())),
+        "total_loans": float(loan_total),
         "transactions": [
             {
                 "id": t.id,
-                "amount": t.amount,
+                "amount": float(t.amount),
+                "currency": t.currency or fx.BASE_CURRENCY,
                 "description": t.description,
                 "date": t.date.isoformat(),
                 "category": t.category.name if t.category else "Uncategorized"
             }
             for t in transactions
         ],
-        "loans": [{"name": l.name, "amount": l.amount} for l in loans],
+        "loans": [{"name": l.name, "amount": float(l.amount), "currency": l.currency or fx.BASE_CURRENCY} for l in loans],
         "income": {"active": current_user.active_income, "passive": current_user.passive_income},
         "categories": [c.name for c in categories]
     }
@@ -61,23 +92,21 @@ async def chat_with_ai(
     result = await ai_agent.process_query(query, user_data)
     return result
 
-@router.get("/insights")
+@router.get("/insights", dependencies=[Depends(statement_timeout(READ_STATEMENT_TIMEOUT_MS))])
 async def get_financial_insights(
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_active_user)
 ):
-    transactions = db.query(Transaction).filter(Transaction.user_id == current_user.id).all()
-    loans = db.query(Loan).filter(Loan.user_id == current_user.id).all()
+    by_category, loan_total = _converted_totals(db, current_user.id)
+    transaction_count = db.query(func.count(Transaction.id)).filter(Transaction.user_id == current_user.id).scalar()
+    loan_count = db.query(func.count(Loan.id)).filter(Loan.user_id == current_user.id).scalar()
     
-    total_spent = sum(t.amount for t in transactions)
+    total_spent = float(sum(by_category.values()))
     total_income = current_user.active_income + current_user.passive_income
     net = total_income - total_spent
     
     # Category breakdown
-    categories = {}
-    for t in transactions:
-        cat = t.category.name if t.category else "Uncategorized"
-        categories[cat] = categories.get(cat, 0) + t.amount
+    categories = {cat: float(amount) for cat, amount in by_category.items()}
     top_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)[:5]
     
     # Health score
@@ -88,17 +117,18 @@ async def get_financial_insights(
             score -= 20
         if total_spent / total_income > 0.5:
             score -= 15
-    if sum(l.amount for l in loans) / (total_income + 1) > 0.4:
+    if float(loan_total) / (total_income + 1) > 0.4:
         score -= 25
     
     rating = "Excellent" if score >= 80 else "Good" if score >= 60 else "Fair" if score >= 40 else "Needs Improvement"
     
     return {
+        "currency": fx.BASE_CURRENCY,
         "total_spent": total_spent,
         "total_income": total_income,
         "net_income": net,
         "top_categories": top_categories,
-        "transaction_count": len(transactions),
-        "loan_count": len(loans),
+        "transaction_count": transaction_count,
+        "loan_count": loan_count,
         "health_score": {"score": max(0, score), "rating": rating}
     }
\ No newline at end of file
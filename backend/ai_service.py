@@ -13,18 +13,21 @@ class FinancialAIAgent:
         try:
             # Build a summary from user data
             transactions = user_data.get('transactions', [])
-            total_spent = sum(t.get('amount', 0) for t in transactions)
+            # Totals arrive already converted to the base currency
+            currency = user_data.get('currency', 'INR')
+            total_spent = user_data.get('total_spent', 0)
             income = user_data.get('income', {})
             active = income.get('active', 0)
             passive = income.get('passive', 0)
             total_income = active + passive
             
             context = f"""
-            User financial summary:
-            - Total spent: ₹{total_spent:.2f}
-            - Total income: ₹{total_income:.2f}
-            - Active income: ₹{active:.2f}
-            - Passive income: ₹{passive:.2f}
+            User financial summary (amounts in {currency}):
+            - Total spent: {currency} {total_spent:.2f}
+            - Total income: {currency} {total_income:.2f}
+            - Active income: {currency} {active:.2f}
+            - Passive income: {currency} {passive:.2f}
+            - Total loans: {currency} {user_data.get('total_loans', 0):.2f}
             - Number of transactions: {len(transactions)}
             """
             
@@ -1,8 +1,13 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+from collections import OrderedDict
 from typing import Optional
+import hmac
+import secrets
+import threading
+import time
 from jose import JWTError, jwt
 import bcrypt
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 import os
@@ -13,6 +18,20 @@ from database import get_db
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "14"))
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "1024"))
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")  # sent as X-Metrics-Token to read /metrics/db
+
+# Set JWT_LIBRARY=pyjwt to verify with PyJWT instead of python-jose (needs
+# PyJWT installed). bench_auth.py compares the two.
+_pyjwt = None
+if os.getenv("JWT_LIBRARY", "jose") == "pyjwt":
+    try:
+        import jwt as _pyjwt
+        if not hasattr(_pyjwt, "PyJWTError"):
+            _pyjwt = None
+    except ImportError:
+        _pyjwt = None
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
@@ -43,15 +62,123 @@ def authenticate_user(db: Session, email: str, password: str):
         return False
     return user
 
+def _encode(claims: dict) -> str:
+    if _pyjwt is not None:
+        return _pyjwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+    return jwt.encode(claims, SECRET_KEY, algorithm=ALGORITHM)
+
+def _decode(token: str) -> dict:
+    """Verify signature and expiry. Raises JWTError on any failure."""
+    if _pyjwt is not None:
+        try:
+            return _pyjwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except _pyjwt.PyJWTError as e:
+            raise JWTError(str(e))
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
-        expire = datetime.utcnow() + expires_delta
+        expire = datetime.now(timezone.utc) + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
+        expire = datetime.now(timezone.utc) + timedelta(minutes=15)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return _encode(to_encode)
+
+def _user_claims(user, token_type: str) -> dict:
+    # uid lets us load the user by primary key, ver lets a password change or
+    # logout-everywhere revoke every outstanding token by bumping token_version
+    return {"sub": str(user.id), "uid": user.id, "ver": user.token_version or 0, "type": token_type}
+
+def create_token_pair(db: Session, user) -> dict:
+    """Issue an access token and a single-use refresh token, recording the latter."""
+    access_token = create_access_token(
+        _user_claims(user, "access"), expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    jti = secrets.token_hex(16)
+    expires = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+    refresh_token = create_access_token({**_user_claims(user, "refresh"), "jti": jti}, expires_delta=expires)
+    # Rows past their expiry can no longer be presented; drop this user's as we go
+    db.query(models.RefreshToken).filter(
+        models.RefreshToken.user_id == user.id, models.RefreshToken.expires_at < datetime.utcnow()
+    ).delete(synchronize_session=False)
+    db.add(models.RefreshToken(jti=jti, user_id=user.id, expires_at=datetime.utcnow() + expires))
+    db.commit()
+    return {"access_token": access_token, "refresh_token": refresh_token, "token_type": "bearer"}
+
+# -------------------- Verified token cache --------------------
+# token -> claims, kept until the token's own expiry. Only tokens that passed
+# signature verification are stored, so a hit skips the crypto entirely.
+_token_cache = OrderedDict()
+_token_cache_lock = threading.Lock()
+
+def decode_token(token: str) -> dict:
+    with _token_cache_lock:
+        claims = _token_cache.get(token)
+        if claims is not None:
+            if claims["exp"] > time.time():
+                _token_cache.move_to_end(token)
+                return claims
+            del _token_cache[token]
+    claims = _decode(token)
+    if "exp" in claims:
+        with _token_cache_lock:
+            _token_cache[token] = claims
+            if len(_token_cache) > TOKEN_CACHE_SIZE:
+                _token_cache.popitem(last=False)
+    return claims
+
+def _user_from_claims(db: Session, claims: dict, token_type: str):
+    """The user a token belongs to, or None if the token is not valid for token_type."""
+    if claims.get("type", "access") != token_type:
+        return None
+    uid = claims.get("uid")
+    if uid is None:
+        # Tokens issued before user-id claims carry only the email
+        email = claims.get("sub")
+        if email is None or token_type != "access":
+            return None
+        return db.query(models.User).filter(models.User.email == email).first()
+    # Set before the lookup so a user who just registered or wrote reads from the primary
+    db.info["user_id"] = uid
+    user = db.get(models.User, uid)
+    if user is None or claims.get("ver", 0) != (user.token_version or 0):
+        return None
+    return user
+
+def refresh_tokens(db: Session, refresh_token: str):
+    """Exchange a refresh token for a new token pair, or None if it is invalid.
+
+    Each refresh token works once. Presenting one that was already exchanged
+    means it leaked, so every token the user holds is revoked.
+    """
+    try:
+        claims = decode_token(refresh_token)
+    except JWTError:
+        return None
+    user = _user_from_claims(db, claims, "refresh")
+    jti = claims.get("jti")
+    if user is None or not user.is_active or jti is None:
+        return None
+    # Conditional update: of two concurrent refreshes with one token, only one wins
+    claimed = db.query(models.RefreshToken).filter(
+        models.RefreshToken.jti == jti,
+        models.RefreshToken.user_id == user.id,
+        models.RefreshToken.used == 0,
+    ).update({"used": 1}, synchronize_session=False)
+    if claimed != 1:
+        if db.get(models.RefreshToken, jti) is not None:
+            revoke_tokens(db, user)
+        else:
+            db.rollback()
+        return None
+    return create_token_pair(db, user)
+
+def revoke_tokens(db: Session, user):
+    """Invalidate every access and refresh token issued to user so far."""
+    user.token_version = (user.token_version or 0) + 1
+    db.query(models.RefreshToken).filter(models.RefreshToken.user_id == user.id).delete(synchronize_session=False)
+    db.commit()
 
 async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
@@ -60,18 +187,21 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
+        claims = decode_token(token)
     except JWTError:
         raise credentials_exception
-    user = db.query(models.User).filter(models.User.email == token_data.email).first()
+    user = _user_from_claims(db, claims, "access")
     if user is None:
         raise credentials_exception
+    # Lets the session keep this user's reads on the primary right after a write
+    db.info["user_id"] = user.id
     return user
 
+def verify_metrics_token(x_metrics_token: Optional[str] = Header(None)):
+    """Guard for operational endpoints: requires METRICS_TOKEN, disabled when it is unset."""
+    if not METRICS_TOKEN or not x_metrics_token or not hmac.compare_digest(x_metrics_token, METRICS_TOKEN):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized")
+
 async def get_current_active_user(current_user: schemas.User = Depends(get_current_user)):
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="Inactive user")
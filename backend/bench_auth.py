@@ -0,0 +1,66 @@
+"""Per-request auth overhead: token verification and user lookup.
+
+Run from backend/:  python bench_auth.py
+Uses a throwaway SQLite file so it never touches the real database.
+"""
+import asyncio
+import os
+import tempfile
+import time
+
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ.pop("DATABASE_READ_URL", None)
+
+from jose import jwt  # noqa: E402
+import auth  # noqa: E402
+import models  # noqa: E402
+from database import SessionLocal, engine  # noqa: E402
+
+N = 20000
+
+def bench(label, fn, n=N):
+    fn()
+    start = time.perf_counter()
+    for _ in range(n):
+        fn()
+    per_call = (time.perf_counter() - start) / n * 1e6
+    print(f"{label:<40} {per_call:8.1f} us/request")
+
+def main():
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    user = models.User(email="bench@example.com", hashed_password="x", token_version=0)
+    db.add(user)
+    db.commit()
+    token = auth.create_token_pair(db, user)["access_token"]
+    legacy_token = auth.create_access_token({"sub": user.email})
+
+    bench("python-jose decode", lambda: jwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]))
+    try:
+        import jwt as pyjwt
+        bench("PyJWT decode", lambda: pyjwt.decode(token, auth.SECRET_KEY, algorithms=[auth.ALGORITHM]))
+    except ImportError:
+        print("PyJWT not installed, skipping")
+    bench("decode_token (cached)", lambda: auth.decode_token(token))
+
+    def uncached():
+        auth._token_cache.clear()
+        auth.decode_token(token)
+    bench("decode_token (cold)", uncached)
+
+    loop = asyncio.new_event_loop()
+
+    def request(t):
+        # A fresh session per call, as each request gets one from get_db
+        session = SessionLocal()
+        try:
+            loop.run_until_complete(auth.get_current_user(t, session))
+        finally:
+            session.close()
+    bench("get_current_user, legacy email token", lambda: request(legacy_token), n=N // 10)
+    bench("get_current_user, cached + id lookup", lambda: request(token), n=N // 10)
+    loop.close()
+    db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,201 @@
 ﻿import os
-from sqlalchemy import create_engine
+import time
+import threading
+from fastapi import Depends
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.sql.expression import Insert, Update, Delete, TextClause
+
+
+def _normalize_url(url):
+    # Fix for Render's PostgreSQL URL (starts with postgres://)
+    if url and url.startswith("postgres://"):
+        url = url.replace("postgres://", "postgresql://", 1)
+    return url
 
 # Use DATABASE_URL from environment, fallback to SQLite for local dev
-SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./finmind.db")
-
-# Fix for Render's PostgreSQL URL (starts with postgres://)
-if SQLALCHEMY_DATABASE_URL.startswith("postgres://"):
-    SQLALCHEMY_DATABASE_URL = SQLALCHEMY_DATABASE_URL.replace("postgres://", "postgresql://", 1)
-
-# Create engine with increased pool size to handle concurrent requests
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    pool_size=10,          # Increased from default 5
-    max_overflow=20,       # Increased from default 10
-    pool_timeout=30,       # Seconds to wait for a connection
-    pool_pre_ping=True     # Optional: checks connection validity before using
-)
-
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLALCHEMY_DATABASE_URL = _normalize_url(os.getenv("DATABASE_URL", "sqlite:///./finmind.db"))
+
+# Optional read replica. When unset, reads and writes share the primary engine.
+# Locally a second SQLite file works, e.g. DATABASE_READ_URL=sqlite:///./finmind_replica.db
+SQLALCHEMY_READ_DATABASE_URL = _normalize_url(os.getenv("DATABASE_READ_URL"))
+
+# After a user writes, their reads stay on the primary for this many seconds so
+# they see their own changes while the replica catches up.
+READ_AFTER_WRITE_SECONDS = float(os.getenv("READ_AFTER_WRITE_SECONDS", "5"))
+
+# Statement timeouts in milliseconds (0 disables). Routes can override the
+# default with Depends(statement_timeout(...)).
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000"))
+READ_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_READ_STATEMENT_TIMEOUT_MS", "30000"))
+
+def _create_engine(url):
+    # Create engine with increased pool size to handle concurrent requests
+    return create_engine(
+        url,
+        pool_size=10,          # Increased from default 5
+        max_overflow=20,       # Increased from default 10
+        pool_timeout=30,       # Seconds to wait for a connection
+        pool_pre_ping=True     # Optional: checks connection validity before using
+    )
+
+engine = _create_engine(SQLALCHEMY_DATABASE_URL)
+read_engine = _create_engine(SQLALCHEMY_READ_DATABASE_URL) if SQLALCHEMY_READ_DATABASE_URL else engine
+
+# -------------------- Read-your-writes stickiness --------------------
+_recent_writes = {}   # user_id -> monotonic time of last committed write
+_recent_writes_lock = threading.Lock()
+
+def _record_write(user_id):
+    now = time.monotonic()
+    with _recent_writes_lock:
+        _recent_writes[user_id] = now
+        if len(_recent_writes) > 10000:
+            cutoff = now - READ_AFTER_WRITE_SECONDS
+            for uid in [u for u, t in _recent_writes.items() if t < cutoff]:
+                del _recent_writes[uid]
+
+def _wrote_recently(user_id):
+    last = _recent_writes.get(user_id)
+    return last is not None and time.monotonic() - last < READ_AFTER_WRITE_SECONDS
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica and everything else to the primary.
+
+    A session sticks to the primary once it has flushed or when created with
+    info={"primary": True}, and so does any user who committed a write within
+    READ_AFTER_WRITE_SECONDS (set session.info["user_id"] to enable that).
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        if read_engine is engine:
+            return engine
+        if self._flushing or isinstance(clause, (Insert, Update, Delete, TextClause)):
+            return engine
+        if self.info.get("wrote") or self.info.get("primary"):
+            return engine
+        user_id = self.info.get("user_id")
+        if user_id is not None and _wrote_recently(user_id):
+            return engine
+        return read_engine
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_wrote(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_write(session):
+    user_id = session.info.get("user_id")
+    if session.info.get("wrote") and user_id is not None:
+        _record_write(user_id)
+
+@event.listens_for(RoutingSession, "after_begin")
+def _attach_session_info(session, transaction, connection):
+    # Lets the engine-level hooks below see the session's statement timeout
+    connection.info["session_info"] = session.info
+
+SessionLocal = sessionmaker(class_=RoutingSession, autocommit=False, autoflush=False)
 Base = declarative_base()
 
+# -------------------- Statement timeouts & pool metrics --------------------
+_pool_stats = {}
+
+def _sqlite_progress_handler(info):
+    def handler():
+        deadline = info.get("deadline")
+        # A non-zero return makes SQLite abort with "interrupted"
+        return 1 if deadline is not None and time.monotonic() > deadline else 0
+    return handler
+
+def _instrument(eng, name):
+    stats = _pool_stats.setdefault(name, {
+        "checkouts": 0,
+        "peak_checked_out": 0,
+        "statement_timeouts": 0,
+    })
+    is_sqlite = eng.dialect.name == "sqlite"
+
+    @event.listens_for(eng, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        if is_sqlite:
+            dbapi_connection.set_progress_handler(
+                _sqlite_progress_handler(connection_record.info), 1000
+            )
+
+    @event.listens_for(eng, "checkout")
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        stats["checkouts"] += 1
+        checked_out = getattr(eng.pool, "checkedout", lambda: 0)()
+        if checked_out > stats["peak_checked_out"]:
+            stats["peak_checked_out"] = checked_out
+
+    @event.listens_for(eng, "checkin")
+    def _on_checkin(dbapi_connection, connection_record):
+        for key in ("session_info", "applied_timeout_ms", "deadline"):
+            connection_record.info.pop(key, None)
+
+    @event.listens_for(eng, "before_cursor_execute")
+    def _apply_timeout(conn, cursor, statement, parameters, context, executemany):
+        session_info = conn.info.get("session_info")
+        timeout_ms = session_info.get("statement_timeout_ms", STATEMENT_TIMEOUT_MS) if session_info is not None else STATEMENT_TIMEOUT_MS
+        if is_sqlite:
+            conn.info["deadline"] = time.monotonic() + timeout_ms / 1000.0 if timeout_ms else None
+        elif eng.dialect.name == "postgresql" and conn.info.get("applied_timeout_ms") != timeout_ms:
+            # SET LOCAL only lasts until the end of the transaction. It goes on its
+            # own cursor: a streamed (yield_per) query's cursor is a named
+            # server-side one that must only ever run the query itself.
+            with cursor.connection.cursor() as set_cursor:
+                set_cursor.execute("SET LOCAL statement_timeout = %d" % timeout_ms)
+            conn.info["applied_timeout_ms"] = timeout_ms
+
+    @event.listens_for(eng, "commit")
+    @event.listens_for(eng, "rollback")
+    def _reset_timeout(conn):
+        conn.info.pop("applied_timeout_ms", None)
+
+    @event.listens_for(eng, "handle_error")
+    def _count_timeouts(context):
+        exc = context.original_exception
+        if getattr(exc, "pgcode", None) == "57014" or "interrupted" in str(exc):
+            stats["statement_timeouts"] += 1
+
+_instrument(engine, "primary")
+if read_engine is not engine:
+    _instrument(read_engine, "replica")
+
+def pool_metrics():
+    """Current pool usage for each engine plus counters since startup."""
+    engines = {"primary": engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+    metrics = {}
+    for name, eng in engines.items():
+        pool = eng.pool
+        metrics[name] = {
+            "dialect": eng.dialect.name,
+            "size": getattr(pool, "size", lambda: None)(),
+            "checked_out": getattr(pool, "checkedout", lambda: None)(),
+            "checked_in": getattr(pool, "checkedin", lambda: None)(),
+            "overflow": getattr(pool, "overflow", lambda: None)(),
+            **_pool_stats[name],
+        }
+    return metrics
+
 # Dependency to get DB session
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def use_primary(db: Session = Depends(get_db)):
+    """Route dependency for check-then-write routes that must not read stale replica data."""
+    db.info["primary"] = True
+
+def statement_timeout(timeout_ms: int):
+    """Route dependency that overrides the statement timeout for the request's session."""
+    def _set_timeout(db: Session = Depends(get_db)):
+        db.info["statement_timeout_ms"] = timeout_ms
+    return _set_timeout
@@ -0,0 +1,170 @@
+import csv
+import io
+import json
+import zlib
+from decimal import Decimal
+from sqlalchemy import select
+from database import SessionLocal
+import models
+
+BATCH_SIZE = 5000
+
+FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+# -------------------- Datasets --------------------
+# Each dataset is a list of (column name, type) and a function building the
+# select for one user. Plain column selects skip ORM object construction.
+def _transactions_query(user_id):
+    T, C = models.Transaction, models.Category
+    return select(T.id, T.date, T.amount, T.currency, T.description, T.category_id, C.name)\
+        .outerjoin(C, T.category_id == C.id)\
+        .where(T.user_id == user_id)\
+        .order_by(T.id)
+
+def _loans_query(user_id):
+    L = models.Loan
+    return select(L.id, L.name, L.amount, L.currency, L.start_date, L.end_date, L.description)\
+        .where(L.user_id == user_id)\
+        .order_by(L.id)
+
+def _categories_query(user_id):
+    C = models.Category
+    return select(C.id, C.name, C.description, C.user_id)\
+        .where((C.user_id == user_id) | (C.user_id == None))\
+        .order_by(C.id)
+
+DATASETS = {
+    "transactions": (
+        [("id", "int"), ("date", "datetime"), ("amount", "decimal"), ("currency", "str"), ("description", "str"),
+         ("category_id", "int"), ("category", "str")],
+        _transactions_query,
+    ),
+    "loans": (
+        [("id", "int"), ("name", "str"), ("amount", "decimal"), ("currency", "str"), ("start_date", "datetime"),
+         ("end_date", "datetime"), ("description", "str")],
+        _loans_query,
+    ),
+    "categories": (
+        [("id", "int"), ("name", "str"), ("description", "str"), ("user_id", "int")],
+        _categories_query,
+    ),
+}
+
+def _batches(dataset: str, user_id: int):
+    """Run the export query and return a generator of row-tuple lists.
+
+    The query runs and the first batch is fetched before this returns, so a
+    failure surfaces as an error response instead of a truncated download.
+    """
+    _, build_query = DATASETS[dataset]
+    # The response outlives the request's session, so the stream opens its own.
+    # No statement timeout: the fetch loop is paced by how fast the client reads.
+    db = SessionLocal(info={"user_id": user_id, "statement_timeout_ms": 0})
+    try:
+        result = db.execute(build_query(user_id).execution_options(yield_per=BATCH_SIZE))
+        partitions = result.partitions()
+        first = next(partitions, None)
+    except Exception:
+        db.close()
+        raise
+    return _stream_batches(db, first, partitions)
+
+def _stream_batches(db, first, partitions):
+    """Yield batches straight from the server-side cursor, then close the session."""
+    try:
+        if first is not None:
+            yield first
+        for partition in partitions:
+            yield partition
+    finally:
+        db.close()
+
+# -------------------- Encoders --------------------
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode("utf-8")
+
+def _json_value(value):
+    # Amounts stay exact: "12.50", not the nearest float
+    if isinstance(value, Decimal):
+        return str(value)
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+def _ndjson_chunks(columns, batches):
+    names = [name for name, _ in columns]
+    for batch in batches:
+        lines = [
+            json.dumps({name: _json_value(value) for name, value in zip(names, row)})
+            for row in batch
+        ]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the generator."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self):
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _parquet_chunks(columns, batches, compression):
+    # Imported here so the app does not pay pyarrow's import cost at startup
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {"int": pa.int64(), "decimal": pa.decimal128(14, 2), "str": pa.string(), "datetime": pa.timestamp("us")}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    sink = _ChunkSink()
+    # One row group per fetched batch keeps memory flat
+    with pq.ParquetWriter(sink, schema, compression=compression) as writer:
+        for batch in batches:
+            arrays = [pa.array([row[i] for row in batch], type=field.type) for i, field in enumerate(schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+def _gzip(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 = gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def export_stream(dataset: str, user_id: int, fmt: str, gzip: bool = False):
+    """Byte chunks of a user's dataset in the given format.
+
+    Parquet compresses internally, so gzip selects its gzip codec instead of
+    wrapping the file.
+    """
+    columns, _ = DATASETS[dataset]
+    batches = _batches(dataset, user_id)
+    if fmt == "parquet":
+        return _parquet_chunks(columns, batches, "gzip" if gzip else "snappy")
+    chunks = _csv_chunks(columns, batches) if fmt == "csv" else _ndjson_chunks(columns, batches)
+    return _gzip(chunks) if gzip else chunks
+
+def export_filename(dataset: str, fmt: str, gzip: bool = False) -> str:
+    name = f"{dataset}.{FORMATS[fmt][1]}"
+    return name + ".gz" if gzip and fmt != "parquet" else name
@@ -0,0 +1,109 @@
+"""FX rates loaded from a local file, cached in memory by date.
+
+The file is a CSV with a header row ``date,currency,rate`` where rate is the
+number of BASE_CURRENCY units one unit of currency buys on that date, e.g.
+``2024-01-02,USD,83.21``. Nothing is fetched over the network.
+
+No rates ship with the app: put the file at backend/fx_rates.csv or point
+FX_RATES_FILE at it. Until then only BASE_CURRENCY amounts are accepted, and
+transactions or loans in other currencies are rejected when they are written.
+"""
+import csv
+import os
+import bisect
+import logging
+import threading
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
+
+logger = logging.getLogger(__name__)
+
+BASE_CURRENCY = os.getenv("BASE_CURRENCY", "INR")
+FX_RATES_FILE = os.getenv("FX_RATES_FILE", os.path.join(os.path.dirname(__file__), "fx_rates.csv"))
+
+CENT = Decimal("0.01")
+
+class MissingRateError(ValueError):
+    pass
+
+_rates = None          # currency -> (sorted list of dates, matching list of Decimal rates)
+_lookup_cache = {}     # (currency, date) -> Decimal rate
+_lock = threading.Lock()
+
+def load_rates(path: str = None):
+    """(Re)load the rate table from path, replacing the cache."""
+    global _rates
+    by_currency = {}
+    path = path or FX_RATES_FILE
+    if os.path.exists(path):
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                day = date.fromisoformat(row["date"].strip())
+                by_currency.setdefault(row["currency"].strip().upper(), []).append((day, Decimal(row["rate"].strip())))
+    else:
+        logger.warning(f"FX rates file {path} not found; only {BASE_CURRENCY} amounts can be converted")
+    rates = {}
+    for currency, points in by_currency.items():
+        points.sort()
+        rates[currency] = ([d for d, _ in points], [r for _, r in points])
+    with _lock:
+        _rates = rates
+        _lookup_cache.clear()
+
+def _as_date(day):
+    if day is None:
+        return None
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, str):
+        return date.fromisoformat(day[:10])
+    return day
+
+def is_supported(currency: str) -> bool:
+    """Whether amounts in currency can be converted to BASE_CURRENCY."""
+    currency = currency.upper()
+    if currency == BASE_CURRENCY:
+        return True
+    if _rates is None:
+        load_rates()
+    return currency in _rates
+
+def rate(currency: str, day) -> Decimal:
+    """Rate to BASE_CURRENCY on day, using the latest rate on or before it.
+
+    Days before the first known rate use the earliest one; a missing day
+    (NULL date) uses the latest.
+    """
+    currency = (currency or BASE_CURRENCY).upper()
+    if currency == BASE_CURRENCY:
+        return Decimal(1)
+    day = _as_date(day)
+    key = (currency, day)
+    cached = _lookup_cache.get(key)
+    if cached is not None:
+        return cached
+    if _rates is None:
+        load_rates()
+    series = _rates.get(currency)
+    if not series:
+        raise MissingRateError(f"No FX rate for {currency}")
+    dates, values = series
+    if day is None:
+        return values[-1]
+    i = max(bisect.bisect_right(dates, day) - 1, 0)
+    _lookup_cache[key] = values[i]
+    return values[i]
+
+def to_base(amount, currency: str, day) -> Decimal:
+    return (Decimal(amount or 0) * rate(currency, day)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+def sum_in_base(groups) -> dict:
+    """Convert pre-aggregated (key, currency, day, amount) rows and total them per key.
+
+    Callers GROUP BY currency and day in SQL, so the conversion runs once per
+    group rather than once per row.
+    """
+    totals = {}
+    for key, currency, day, amount in groups:
+        totals[key] = totals.get(key, Decimal(0)) + to_base(amount, currency, day)
+    return totals
@@ -1,20 +1,25 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
-from datetime import timedelta
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 import models
 import schemas
 import auth
-from database import get_db, SessionLocal, engine
+from database import get_db, SessionLocal, engine, statement_timeout, use_primary, pool_metrics, READ_STATEMENT_TIMEOUT_MS
 from categorizer import suggest_category
+from search import ensure_search_index, create_postgres_search_indexes, search_transactions
+import export
+import fx
 from sqlalchemy import text
 
 # Uncomment when AI chat is ready
 # from ai import router as ai_router
 
 models.Base.metadata.create_all(bind=engine)
+ensure_search_index(engine)
 
 app = FastAPI()
 
@@ -55,13 +60,18 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
     db.commit()
     return {"message": f"User {user_id} deleted"}
 
-@app.get("/fix-db")
+@app.get("/fix-db", dependencies=[Depends(statement_timeout(0))])
 def fix_database(db: Session = Depends(get_db)):
     try:
         db.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS active_income FLOAT DEFAULT 0.0;"))
         db.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS passive_income FLOAT DEFAULT 0.0;"))
+        db.execute(text("ALTER TABLE users ADD COLUMN IF NOT EXISTS token_version INTEGER DEFAULT 0;"))
         db.execute(text("ALTER TABLE transactions ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);"))
         db.execute(text("ALTER TABLE loans ADD COLUMN IF NOT EXISTS user_id INTEGER REFERENCES users(id);"))
+        db.execute(text(f"ALTER TABLE transactions ADD COLUMN IF NOT EXISTS currency VARCHAR(3) DEFAULT '{fx.BASE_CURRENCY}';"))
+        db.execute(text(f"ALTER TABLE loans ADD COLUMN IF NOT EXISTS currency VARCHAR(3) DEFAULT '{fx.BASE_CURRENCY}';"))
+        db.execute(text("ALTER TABLE transactions ALTER COLUMN amount TYPE NUMERIC(14, 2);"))
+        db.execute(text("ALTER TABLE loans ALTER COLUMN amount TYPE NUMERIC(14, 2);"))
         db.commit()
         return {"message": "Database schema updated."}
     except Exception as e:
@@ -77,8 +87,23 @@ def fix_db_categories(db: Session = Depends(get_db)):
     except Exception as e:
         db.rollback()
         return {"error": str(e)}
+
+@app.get("/fix-db-search")
+def fix_db_search():
+    if engine.dialect.name != "postgresql":
+        return {"message": "Search indexes are built at startup on this database."}
+    try:
+        fuzzy = create_postgres_search_indexes(engine)
+        return {"message": "Search indexes built.", "fuzzy_search": fuzzy}
+    except Exception as e:
+        return {"error": str(e)}
 # ------------------------------------------------------------------
 
+# -------------------- Metrics --------------------
+@app.get("/metrics/db", dependencies=[Depends(auth.verify_metrics_token)])
+def db_metrics():
+    return pool_metrics()
+
 # -------------------- User Income Endpoints --------------------
 @app.get("/user/income", response_model=schemas.User)
 def get_user_income(current_user: models.User = Depends(auth.get_current_active_user)):
@@ -98,7 +123,7 @@ def update_income(
     return current_user
 
 # -------------------- Authentication Endpoints --------------------
-@app.post("/register", response_model=schemas.User)
+@app.post("/register", response_model=schemas.User, dependencies=[Depends(use_primary)])
 def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
     db_user = db.query(models.User).filter(models.User.email == user.email).first()
     if db_user:
@@ -115,11 +140,14 @@ def register(user: schemas.UserCreate, db: Session = Depends(get_db)):
         passive_income=user.passive_income
     )
     db.add(db_user)
+    db.flush()
+    # Record the write against the new user so their first requests read from the primary
+    db.info["user_id"] = db_user.id
     db.commit()
     db.refresh(db_user)
     return db_user
 
-@app.post("/token", response_model=schemas.Token)
+@app.post("/token", response_model=schemas.Token, dependencies=[Depends(use_primary)])
 def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     # Authentication (truncation handled inside auth.authenticate_user)
     user = auth.authenticate_user(db, form_data.username, form_data.password)
@@ -129,11 +157,27 @@ def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depend
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token_expires = timedelta(minutes=auth.ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = auth.create_access_token(
-        data={"sub": user.email}, expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    return auth.create_token_pair(db, user)
+
+@app.post("/token/refresh", response_model=schemas.Token, dependencies=[Depends(use_primary)])
+def refresh_token(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    tokens = auth.refresh_tokens(db, request.refresh_token)
+    if not tokens:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return tokens
+
+@app.post("/logout")
+def logout(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    # Signs the user out on every device: all outstanding tokens stop validating
+    auth.revoke_tokens(db, current_user)
+    return {"message": "Logged out"}
 
 @app.get("/users/me", response_model=schemas.User)
 def read_users_me(current_user: schemas.User = Depends(auth.get_current_active_user)):
@@ -184,7 +228,8 @@ def create_transaction(
     db.refresh(db_transaction)
     return db_transaction
 
-@app.get("/transactions/", response_model=List[schemas.Transaction])
+@app.get("/transactions/", response_model=List[schemas.Transaction],
+         dependencies=[Depends(statement_timeout(READ_STATEMENT_TIMEOUT_MS))])
 def read_transactions(
     skip: int = 0,
     limit: int = 100,
@@ -197,6 +242,37 @@ def read_transactions(
         .offset(skip).limit(limit).all()
     return transactions
 
+@app.get("/transactions/search", response_model=schemas.TransactionSearchPage,
+         dependencies=[Depends(statement_timeout(READ_STATEMENT_TIMEOUT_MS))])
+def search_transactions_endpoint(
+    q: str,
+    fuzzy: bool = True,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    try:
+        items, next_cursor = search_transactions(
+            db, current_user.id, q,
+            fuzzy=fuzzy,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            start_date=start_date,
+            end_date=end_date,
+            category_id=category_id,
+            after=after,
+            limit=max(1, min(limit, 100)),
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"items": items, "next_cursor": next_cursor}
+
 @app.delete("/transactions/{transaction_id}")
 def delete_transaction(
     transaction_id: int,
@@ -255,7 +331,8 @@ def create_loan(
     db.refresh(db_loan)
     return db_loan
 
-@app.get("/loans/", response_model=List[schemas.Loan])
+@app.get("/loans/", response_model=List[schemas.Loan],
+         dependencies=[Depends(statement_timeout(READ_STATEMENT_TIMEOUT_MS))])
 def read_loans(
     skip: int = 0,
     limit: int = 100,
@@ -301,10 +378,30 @@ def delete_loan(
     db.commit()
     return {"message": "Loan deleted successfully"}
 
+# -------------------- Export --------------------
+@app.get("/export/{dataset}")
+def export_dataset(
+    dataset: str,
+    format: str = "csv",
+    gzip: bool = False,
+    current_user: models.User = Depends(auth.get_current_active_user)
+):
+    if dataset not in export.DATASETS:
+        raise HTTPException(status_code=404, detail="Unknown dataset")
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail="Format must be csv, ndjson or parquet")
+    media_type = "application/gzip" if gzip and format != "parquet" else export.FORMATS[format][0]
+    filename = export.export_filename(dataset, format, gzip)
+    return StreamingResponse(
+        export.export_stream(dataset, current_user.id, format, gzip),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # -------------------- Startup event --------------------
 @app.on_event("startup")
 def startup_event():
-    db = SessionLocal()
+    db = SessionLocal(info={"primary": True})
     default_cats = [
         "Food & Drink", "Transport", "Shopping", "Entertainment",
         "Bills & Utilities", "Healthcare", "Education", "Income",
@@ -1,7 +1,8 @@
-﻿from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey
+﻿from sqlalchemy import Column, Integer, String, Float, Numeric, DateTime, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from database import Base
+from fx import BASE_CURRENCY
 
 class User(Base):
     __tablename__ = "users"
@@ -13,6 +14,7 @@ class User(Base):
     is_active = Column(Integer, default=1)
     active_income = Column(Float, default=0.0)
     passive_income = Column(Float, default=0.0)
+    token_version = Column(Integer, default=0)  # bump to revoke all issued tokens
 
     transactions = relationship("Transaction", back_populates="owner")
     loans = relationship("Loan", back_populates="owner")
@@ -33,7 +35,8 @@ class Transaction(Base):
     __tablename__ = "transactions"
     
     id = Column(Integer, primary_key=True, index=True)
-    amount = Column(Float)
+    amount = Column(Numeric(14, 2))  # exact, in units of currency
+    currency = Column(String(3), default=BASE_CURRENCY)
     description = Column(String, index=True)
     date = Column(DateTime, default=datetime.utcnow)
     category_id = Column(Integer, ForeignKey("categories.id"), nullable=True)
@@ -42,15 +45,28 @@ class Transaction(Base):
     category = relationship("Category", back_populates="transactions")
     owner = relationship("User", back_populates="transactions")
 
+    # Serves per-user history listings and keyset pagination (newest first)
+    __table_args__ = (Index("ix_transactions_user_date", "user_id", "date", "id"),)
+
 class Loan(Base):
     __tablename__ = "loans"
     
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
-    amount = Column(Float)
+    amount = Column(Numeric(14, 2))
+    currency = Column(String(3), default=BASE_CURRENCY)
     start_date = Column(DateTime, default=datetime.utcnow)
     end_date = Column(DateTime, nullable=True)
     description = Column(String, nullable=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     
-    owner = relationship("User", back_populates="loans")
\ No newline at end of file
+    owner = relationship("User", back_populates="loans")
+
+class RefreshToken(Base):
+    __tablename__ = "refresh_tokens"
+
+    # One row per issued refresh token; each can be exchanged exactly once
+    jti = Column(String(32), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    expires_at = Column(DateTime)
+    used = Column(Integer, default=0)
@@ -1,6 +1,27 @@
-﻿from pydantic import BaseModel, EmailStr
+﻿from pydantic import BaseModel, EmailStr, computed_field, field_validator
 from datetime import datetime
 from typing import Optional, List
+import fx
+from fx import BASE_CURRENCY
+
+def _check_currency(value):
+    """Normalize to an upper-case ISO code and reject currencies we cannot convert."""
+    if value is None:
+        return BASE_CURRENCY
+    code = value.strip().upper() if isinstance(value, str) else ""
+    if len(code) != 3 or not (code.isascii() and code.isalpha()):
+        raise ValueError("currency must be a 3-letter ISO code")
+    if not fx.is_supported(code):
+        raise ValueError(f"No FX rate for {code}; add it to the rates file ({fx.FX_RATES_FILE})")
+    return code
+
+def _amount_in_base(amount, currency, day):
+    """amount converted to BASE_CURRENCY at day's rate, or None without a rate."""
+    try:
+        # str() so a float such as 10.1 converts as written, not as its binary value
+        return float(fx.to_base(str(amount), currency, day))
+    except fx.MissingRateError:
+        return None
 
 # -------------------- User schemas --------------------
 class UserBase(BaseModel):
@@ -23,9 +44,10 @@ class User(UserBase):
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
 
-class TokenData(BaseModel):
-    email: Optional[str] = None
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 # -------------------- Category schemas --------------------
 class CategoryBase(BaseModel):
@@ -45,37 +67,61 @@ class Category(CategoryBase):
 # -------------------- Transaction schemas --------------------
 class TransactionBase(BaseModel):
     amount: float
+    currency: str = BASE_CURRENCY
     description: str
     date: Optional[datetime] = None
     category_id: Optional[int] = None
 
 class TransactionCreate(TransactionBase):
-    pass
+    @field_validator("currency", mode="before")
+    @classmethod
+    def check_currency(cls, value):
+        return _check_currency(value)
 
 class Transaction(TransactionBase):
     id: int
     date: datetime
     category: Optional[Category] = None
     user_id: int
+
+    @computed_field
+    @property
+    def amount_base(self) -> Optional[float]:
+        """Amount in BASE_CURRENCY, for totals across currencies."""
+        return _amount_in_base(self.amount, self.currency, self.date)
     
     class Config:
         from_attributes = True
 
+class TransactionSearchPage(BaseModel):
+    items: List[Transaction]
+    next_cursor: Optional[str] = None  # pass back as ?after= for the next page
+
 # -------------------- Loan schemas --------------------
 class LoanBase(BaseModel):
     name: str
     amount: float
+    currency: str = BASE_CURRENCY
     start_date: Optional[datetime] = None
     end_date: Optional[datetime] = None
     description: Optional[str] = None
 
 class LoanCreate(LoanBase):
-    pass
+    @field_validator("currency", mode="before")
+    @classmethod
+    def check_currency(cls, value):
+        return _check_currency(value)
 
 class Loan(LoanBase):
     id: int
     start_date: datetime
     user_id: int
+
+    @computed_field
+    @property
+    def amount_base(self) -> Optional[float]:
+        """Amount in BASE_CURRENCY at the start date's rate."""
+        return _amount_in_base(self.amount, self.currency, self.start_date)
     
     class Config:
         from_attributes = True
\ No newline at end of file
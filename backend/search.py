@@ -0,0 +1,239 @@
+import re
+import logging
+from datetime import datetime
+from typing import Optional
+from fuzzywuzzy import fuzz
+from sqlalchemy import select, text, func, or_, and_, table, column, literal, literal_column
+from sqlalchemy.orm import Session
+import models
+
+logger = logging.getLogger(__name__)
+
+FUZZY_THRESHOLD = 80          # fuzz.ratio score for a vocabulary term to count as a typo match
+MAX_FUZZY_TERMS = 10          # alternatives added per query word
+MAX_FUZZY_CANDIDATES = 2000   # vocabulary terms scored per query word
+FTS_DRIVEN_MAX_MATCHES = 5000 # above this, walking the user's date index is cheaper
+
+# Set by ensure_search_index once pg_trgm and its index exist
+trigram_available = False
+
+_fts = table("transactions_fts", column("rowid"))
+_fts_vocab = table("transactions_fts_vocab", column("term"))
+
+# -------------------- Index setup --------------------
+_SQLITE_DDL = [
+    # External-content table: the text lives in transactions, FTS5 only keeps the index
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts USING fts5("
+    "description, content='transactions', content_rowid='id')",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS transactions_fts_vocab USING fts5vocab(transactions_fts, 'row')",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_ai AFTER INSERT ON transactions BEGIN "
+    "INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_ad AFTER DELETE ON transactions BEGIN "
+    "INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description); END",
+    "CREATE TRIGGER IF NOT EXISTS transactions_fts_au AFTER UPDATE OF description ON transactions BEGIN "
+    "INSERT INTO transactions_fts(transactions_fts, rowid, description) VALUES ('delete', old.id, old.description); "
+    "INSERT INTO transactions_fts(rowid, description) VALUES (new.id, new.description); END",
+]
+
+# Postgres indexes are built by the /fix-db-search migration, not at startup:
+# on a large table even CREATE INDEX CONCURRENTLY takes a while.
+_POSTGRES_DDL = [
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_user_date ON transactions (user_id, date, id)",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_description_tsv ON transactions "
+    "USING GIN (to_tsvector('simple', coalesce(description, '')))",
+]
+
+_POSTGRES_TRGM_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_transactions_description_trgm ON transactions "
+    "USING GIN (description gin_trgm_ops)",
+]
+
+def _without_timeout(conn):
+    # Index builds can outlast DB_STATEMENT_TIMEOUT_MS; read by database._apply_timeout
+    conn.info["session_info"] = {"statement_timeout_ms": 0}
+
+def ensure_search_index(engine):
+    """Startup hook: build the SQLite text index, or detect the Postgres ones."""
+    global trigram_available
+    if engine.dialect.name == "sqlite":
+        # create_all skips indexes on tables that already exist, e.g. the user/date index
+        for index in models.Transaction.__table__.indexes:
+            index.create(bind=engine, checkfirst=True)
+        with engine.begin() as conn:
+            _without_timeout(conn)
+            exists = conn.execute(text(
+                "SELECT 1 FROM sqlite_master WHERE name = 'transactions_fts'"
+            )).first()
+            for ddl in _SQLITE_DDL:
+                conn.execute(text(ddl))
+            if not exists:
+                # Index rows that were written before the FTS table existed
+                conn.execute(text("INSERT INTO transactions_fts(transactions_fts) VALUES ('rebuild')"))
+    elif engine.dialect.name == "postgresql":
+        with engine.connect() as conn:
+            indexes = {row[0] for row in conn.execute(text(
+                "SELECT indexname FROM pg_indexes WHERE tablename = 'transactions'"
+            ))}
+        trigram_available = "ix_transactions_description_trgm" in indexes
+        if "ix_transactions_description_tsv" not in indexes:
+            logger.warning("Search indexes missing; run /fix-db-search to build them")
+
+def create_postgres_search_indexes(engine):
+    """Build the Postgres search indexes without blocking writes (idempotent).
+
+    Returns whether fuzzy (pg_trgm) search is available afterwards.
+    """
+    global trigram_available
+    # CONCURRENTLY cannot run inside a transaction block
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        _without_timeout(conn)
+        conn.execute(text("SET statement_timeout = 0"))
+        try:
+            # A build that failed or was cancelled leaves an INVALID index that
+            # IF NOT EXISTS would skip; drop it so it is rebuilt
+            invalid = conn.execute(text(
+                "SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                "WHERE NOT i.indisvalid AND i.indrelid = 'transactions'::regclass"
+            )).scalars().all()
+            for name in invalid:
+                conn.execute(text(f'DROP INDEX CONCURRENTLY IF EXISTS "{name}"'))
+            for ddl in _POSTGRES_DDL:
+                conn.execute(text(ddl))
+            try:
+                for ddl in _POSTGRES_TRGM_DDL:
+                    conn.execute(text(ddl))
+                trigram_available = True
+            except Exception as e:
+                logger.warning(f"pg_trgm unavailable, fuzzy search disabled: {e}")
+        finally:
+            conn.execute(text("RESET statement_timeout"))
+    return trigram_available
+
+# -------------------- Query building --------------------
+def _tokenize(q: str):
+    return [w.lower() for w in re.findall(r"\w+", q)]
+
+def _fuzzy_terms(db: Session, word: str):
+    """Indexed terms within a small edit distance of word, from the FTS5 vocabulary."""
+    if len(word) < 3:
+        return []
+    # Typos rarely hit the first letter, which keeps the vocab scan to one range.
+    # A ratio of FUZZY_THRESHOLD (80) needs the shorter term to be at least 2/3
+    # the length of the longer, so the length window drops no real matches.
+    n = len(word)
+    rows = db.execute(
+        select(_fts_vocab.c.term)
+        .where(
+            _fts_vocab.c.term >= word[0],
+            _fts_vocab.c.term < chr(ord(word[0]) + 1),
+            func.length(_fts_vocab.c.term).between((2 * n) // 3, (3 * n) // 2 + 1),
+        )
+        .limit(MAX_FUZZY_CANDIDATES)
+    ).all()
+    scored = [(fuzz.ratio(word, term), term) for (term,) in rows if term != word]
+    scored = [s for s in scored if s[0] >= FUZZY_THRESHOLD]
+    scored.sort(reverse=True)
+    return [term for _, term in scored[:MAX_FUZZY_TERMS]]
+
+def _sqlite_match(db: Session, words, fuzzy: bool):
+    clauses = []
+    for word in words:
+        options = [f'"{word}"*']
+        if fuzzy:
+            options += [f'"{term}"' for term in _fuzzy_terms(db, word)]
+        clauses.append("(" + " OR ".join(options) + ")")
+    match = literal_column("transactions_fts").op("MATCH")(" AND ".join(clauses))
+    return select(_fts.c.rowid).where(match)
+
+def _many_matches(db: Session, fts_rowids) -> bool:
+    """Whether the FTS query matches more than FTS_DRIVEN_MAX_MATCHES rows (all users).
+
+    The LIMIT bounds the cost even for words present in every row.
+    """
+    capped = fts_rowids.limit(FTS_DRIVEN_MAX_MATCHES + 1).subquery()
+    return db.execute(select(func.count()).select_from(capped)).scalar() > FTS_DRIVEN_MAX_MATCHES
+
+def _postgres_match(q: str, words, fuzzy: bool):
+    tsquery = " & ".join(f"{word}:*" for word in words)
+    document = func.to_tsvector("simple", func.coalesce(models.Transaction.description, ""))
+    condition = document.op("@@")(func.to_tsquery("simple", tsquery))
+    if fuzzy and trigram_available:
+        # Word similarity (<%) matches a misspelled word inside a long description
+        condition = or_(condition, literal(q).op("<%")(models.Transaction.description))
+    return condition
+
+def _text_condition(dialect: str, words, q: str, fuzzy: bool):
+    if dialect == "postgresql":
+        return _postgres_match(q, words, fuzzy)
+    return and_(*[models.Transaction.description.ilike(f"%{word}%") for word in words])
+
+# -------------------- Keyset cursor --------------------
+# Results are ordered date desc, id desc with undated rows last; their
+# cursors carry "null" in place of the date.
+def encode_cursor(transaction) -> str:
+    day = transaction.date.isoformat() if transaction.date is not None else "null"
+    return f"{day}|{transaction.id}"
+
+def decode_cursor(cursor: str):
+    date_str, id_str = cursor.rsplit("|", 1)
+    return (None if date_str == "null" else datetime.fromisoformat(date_str)), int(id_str)
+
+def _after(after_date, after_id):
+    T = models.Transaction
+    if after_date is None:
+        return and_(T.date == None, T.id < after_id)
+    return or_(T.date < after_date, and_(T.date == after_date, T.id < after_id), T.date == None)
+
+def search_transactions(
+    db: Session,
+    user_id: int,
+    q: str,
+    fuzzy: bool = True,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    start_date: Optional[datetime] = None,
+    end_date: Optional[datetime] = None,
+    category_id: Optional[int] = None,
+    after: Optional[str] = None,
+    limit: int = 50,
+):
+    """Return (transactions, next_cursor) matching q, newest first.
+
+    Raises ValueError for a malformed cursor.
+    """
+    words = _tokenize(q)
+    if not words:
+        # Nothing searchable (e.g. only punctuation): match nothing rather than everything
+        return [], None
+
+    T = models.Transaction
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        fts_rowids = _sqlite_match(db, words, fuzzy)
+        if _many_matches(db, fts_rowids):
+            # Common words: walk the user's (user_id, date) index, which stops as
+            # soon as a page is filled
+            query = db.query(T).filter(T.user_id == user_id, T.id.in_(fts_rowids))
+        else:
+            # "+ 0" keeps SQLite off that index so the plan starts from the few
+            # FTS matches instead of every row the user has
+            query = db.query(T).filter((T.user_id + 0) == user_id, T.id.in_(fts_rowids))
+    else:
+        query = db.query(T).filter(T.user_id == user_id, _text_condition(dialect, words, q, fuzzy))
+    if min_amount is not None:
+        query = query.filter(T.amount >= min_amount)
+    if max_amount is not None:
+        query = query.filter(T.amount <= max_amount)
+    if start_date is not None:
+        query = query.filter(T.date >= start_date)
+    if end_date is not None:
+        query = query.filter(T.date <= end_date)
+    if category_id is not None:
+        query = query.filter(T.category_id == category_id)
+    if after:
+        query = query.filter(_after(*decode_cursor(after)))
+
+    rows = query.order_by(T.date.desc().nulls_last(), T.id.desc()).limit(limit + 1).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
@@ -419,24 +419,30 @@ function Dashboard() {
   };
 
   // Calculations
+  // Totals use amount_base (converted to ₹ by the API) so mixed currencies add up
+  const inBase = item => item.amount_base ?? item.amount;
+  const formatAmount = item => (!item.currency || item.currency === 'INR')
+    ? `₹${item.amount.toFixed(2)}`
+    : `${item.currency} ${item.amount.toFixed(2)} (₹${inBase(item).toFixed(2)})`;
+
   const activeNum = activeIncome === '' ? 0 : parseFloat(activeIncome);
   const passiveNum = passiveIncome === '' ? 0 : parseFloat(passiveIncome);
 
   const otherIncome = transactions.reduce((acc, tx) => {
     if (tx.category && tx.category.name.toLowerCase().includes('income')) {
-      acc += tx.amount;
+      acc += inBase(tx);
     }
     return acc;
   }, 0);
 
   const expensesFromTransactions = transactions.reduce((acc, tx) => {
     if (!tx.category || !tx.category.name.toLowerCase().includes('income')) {
-      acc += tx.amount;
+      acc += inBase(tx);
     }
     return acc;
   }, 0);
 
-  const totalEMI = loans.reduce((acc, loan) => acc + loan.amount, 0);
+  const totalEMI = loans.reduce((acc, loan) => acc + inBase(loan), 0);
   const totalExpenses = expensesFromTransactions + totalEMI;
   const totalIncome = activeNum + passiveNum + otherIncome;
   const net = totalIncome - totalExpenses;
@@ -446,7 +452,7 @@ function Dashboard() {
     .filter(tx => !tx.category?.name.toLowerCase().includes('income'))
     .reduce((acc, tx) => {
       const catName = tx.category?.name || 'Uncategorized';
-      acc[catName] = (acc[catName] || 0) + tx.amount;
+      acc[catName] = (acc[catName] || 0) + inBase(tx);
       return acc;
     }, {});
 
@@ -661,7 +667,7 @@ function Dashboard() {
                         <span className="badge bg-secondary">{new Date(tx.date).toLocaleDateString()}</span>
                       </div>
                       <span className={`amount ${tx.category?.name.toLowerCase().includes('income') ? 'text-success' : 'text-danger'}`}>
-                        ₹{tx.amount.toFixed(2)}
+                        {formatAmount(tx)}
                       </span>
                     </div>
                     <div className="description mt-2">{tx.description}</div>
@@ -752,7 +758,7 @@ function Dashboard() {
                   <Card>
                     <Card.Body>
                       <Card.Title>{loan.name}</Card.Title>
-                      <Card.Subtitle className="mb-2 text-muted">₹{loan.amount}/month</Card.Subtitle>
+                      <Card.Subtitle className="mb-2 text-muted">{formatAmount(loan)}/month</Card.Subtitle>
                       <Card.Text>
                         Started: {new Date(loan.start_date).toLocaleDateString()}
                         {loan.end_date && ` • Ends: ${new Date(loan.end_date).toLocaleDateString()}`}